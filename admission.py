@@ -0,0 +1,325 @@
+import socket
+import threading
+import time
+from collections import deque
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+from typing import Dict, Optional
+
+from flask import Flask, request, g, jsonify, abort, render_template
+
+# Route classes in priority order (lower number is served first)
+CRITICAL = 'critical'
+NORMAL = 'normal'
+LOW = 'low'
+PRIORITY = {CRITICAL: 0, NORMAL: 1, LOW: 2}
+
+# Money-moving routes: gateway callbacks, webhooks and client-side verification
+CRITICAL_ENDPOINTS = {
+    'webhooks.webhook_razorpay',
+    'webhooks.webhook_bbps',
+    'payu_success',
+    'payu_failure',
+    'payu_verify_api',
+    'verify_payment',
+}
+# Browser form POSTs from PayU (surl/furl): nobody retries these, so a shed request
+# gets a page that re-submits the same form instead of a bare 503
+BROWSER_CALLBACK_ENDPOINTS = {
+    'payu_success',
+    'payu_failure',
+}
+# Reporting routes that can be shed first under load
+LOW_ENDPOINTS = {
+    'admin',
+    'receipt_pdf',
+}
+# Never queued: Fly health checks, metrics scrapes and static files
+EXEMPT_ENDPOINTS = {
+    'healthz',
+    'metrics',
+    'static',
+}
+
+# WSGI environ flag set only by the internal metrics listener; clients cannot forge it
+INTERNAL_ENVIRON_KEY = 'admission.internal'
+
+WAIT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def classify_endpoint(endpoint: Optional[str]) -> Optional[str]:
+    """Return the route class for a Flask endpoint, or None if it bypasses admission."""
+    if endpoint is None or endpoint in EXEMPT_ENDPOINTS:
+        return None
+    if endpoint in CRITICAL_ENDPOINTS:
+        return CRITICAL
+    if endpoint in LOW_ENDPOINTS:
+        return LOW
+    return NORMAL
+
+
+class _Waiter:
+    __slots__ = ('route_class', 'granted')
+
+    def __init__(self, route_class: str):
+        self.route_class = route_class
+        self.granted = False
+
+
+class AdmissionController:
+    """Per-process concurrency budgets with a priority queue across route classes.
+
+    A request runs only when both the global budget (max_active) and its class
+    budget have a free slot. Waiters are granted slots in priority order, FIFO
+    within a class. Arrivals are shed at once when their class queue is at its
+    depth cap (max_queue); queued waiters are shed once their max_wait elapses.
+    """
+
+    def __init__(self, max_active: int, limits: Dict[str, int], max_wait: Dict[str, Optional[float]],
+                 max_queue: Optional[Dict[str, Optional[int]]] = None):
+        self.max_active = max_active
+        self.limits = dict(limits)
+        self.max_wait = dict(max_wait)
+        self.max_queue = dict(max_queue or {})
+        self._cond = threading.Condition()
+        self._queues = {c: deque() for c in PRIORITY}
+        self._active_total = 0
+        self._active = {c: 0 for c in PRIORITY}
+        self._admitted = {c: 0 for c in PRIORITY}
+        self._shed = {c: 0 for c in PRIORITY}
+        self._wait_sum = {c: 0.0 for c in PRIORITY}
+        self._wait_buckets = {c: [0] * len(WAIT_BUCKETS) for c in PRIORITY}
+
+    def _has_room(self, route_class: str) -> bool:
+        return self._active_total < self.max_active and self._active[route_class] < self.limits[route_class]
+
+    def _take_slot(self, route_class: str) -> None:
+        self._active_total += 1
+        self._active[route_class] += 1
+
+    def _dispatch(self) -> None:
+        """Grant free slots to queued waiters, highest priority first. Caller holds the lock."""
+        granted = False
+        for route_class in sorted(PRIORITY, key=PRIORITY.get):
+            queue = self._queues[route_class]
+            # A full class budget lets lower-priority classes use the global slot
+            while queue and self._has_room(route_class):
+                self._take_slot(route_class)
+                queue.popleft().granted = True
+                granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _queue_full(self, route_class: str) -> bool:
+        """Shed on arrival instead of tying up a thread for the full max_wait. Caller holds the lock."""
+        cap = self.max_queue.get(route_class)
+        return cap is not None and len(self._queues[route_class]) >= cap
+
+    def _record_wait(self, route_class: str, waited: float) -> None:
+        self._admitted[route_class] += 1
+        self._wait_sum[route_class] += waited
+        buckets = self._wait_buckets[route_class]
+        for i, bound in enumerate(WAIT_BUCKETS):
+            if waited <= bound:
+                buckets[i] += 1
+
+    def acquire(self, route_class: str) -> bool:
+        """Block until a slot is granted. Returns False if the request was shed."""
+        start = time.monotonic()
+        max_wait = self.max_wait.get(route_class)
+        with self._cond:
+            # Fast path only when nobody of equal or higher priority is already queued
+            queued_ahead = any(self._queues[c] for c, p in PRIORITY.items() if p <= PRIORITY[route_class])
+            if not queued_ahead and self._has_room(route_class):
+                self._take_slot(route_class)
+                self._record_wait(route_class, 0.0)
+                return True
+            if self._queue_full(route_class):
+                self._shed[route_class] += 1
+                return False
+
+            waiter = _Waiter(route_class)
+            self._queues[route_class].append(waiter)
+            self._dispatch()
+            deadline = start + max_wait if max_wait is not None else None
+            while not waiter.granted:
+                if deadline is None:
+                    self._cond.wait()
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._queues[route_class].remove(waiter)
+                    self._shed[route_class] += 1
+                    return False
+                self._cond.wait(remaining)
+            self._record_wait(route_class, time.monotonic() - start)
+            return True
+
+    def release(self, route_class: str) -> None:
+        with self._cond:
+            self._active_total -= 1
+            self._active[route_class] -= 1
+            self._dispatch()
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        with self._cond:
+            return {
+                c: {
+                    'limit': self.limits[c],
+                    'active': self._active[c],
+                    'queued': len(self._queues[c]),
+                    'admitted': self._admitted[c],
+                    'shed': self._shed[c],
+                    'wait_sum': self._wait_sum[c],
+                    'wait_buckets': list(self._wait_buckets[c]),
+                }
+                for c in PRIORITY
+            }
+
+    def render_metrics(self) -> str:
+        """Render counters and gauges in the Prometheus text exposition format."""
+        snap = self.snapshot()
+        lines = [
+            '# HELP admission_max_active Global concurrency budget for this process.',
+            '# TYPE admission_max_active gauge',
+            f'admission_max_active {self.max_active}',
+        ]
+        gauges = [
+            ('admission_limit', 'limit', 'Concurrency budget per route class.'),
+            ('admission_active', 'active', 'Requests currently running per route class.'),
+            ('admission_queue_depth', 'queued', 'Requests waiting for a slot per route class.'),
+        ]
+        for name, key, help_text in gauges:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+            lines += [f'{name}{{class="{c}"}} {s[key]}' for c, s in snap.items()]
+        counters = [
+            ('admission_admitted_total', 'admitted', 'Requests admitted per route class.'),
+            ('admission_shed_total', 'shed', 'Requests rejected with 503 per route class.'),
+        ]
+        for name, key, help_text in counters:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            lines += [f'{name}{{class="{c}"}} {s[key]}' for c, s in snap.items()]
+        lines += [
+            '# HELP admission_wait_seconds Time spent queued before admission.',
+            '# TYPE admission_wait_seconds histogram',
+        ]
+        for c, s in snap.items():
+            for bound, count in zip(WAIT_BUCKETS, s['wait_buckets']):
+                lines.append(f'admission_wait_seconds_bucket{{class="{c}",le="{bound}"}} {count}')
+            lines.append(f'admission_wait_seconds_bucket{{class="{c}",le="+Inf"}} {s["admitted"]}')
+            lines.append(f'admission_wait_seconds_sum{{class="{c}"}} {s["wait_sum"]}')
+            lines.append(f'admission_wait_seconds_count{{class="{c}"}} {s["admitted"]}')
+        return '\n'.join(lines) + '\n'
+
+
+class _MetricsServer(WSGIServer):
+    address_family = socket.AF_INET6
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(app: Flask, host: str, port: int) -> None:
+    """Serve /metrics on an internal port (Fly private network only) in a daemon thread.
+
+    Called from gunicorn's post_worker_init hook so the listener lives in the worker
+    that owns app.extensions['admission'], not at import time.
+    """
+    def internal_app(environ, start_response):
+        if environ.get('PATH_INFO') != '/metrics':
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return [b'Not Found']
+        environ[INTERNAL_ENVIRON_KEY] = True
+        return app.wsgi_app(environ, start_response)
+
+    try:
+        server = make_server(host, port, internal_app, server_class=_MetricsServer, handler_class=_QuietHandler)
+    except OSError as e:
+        # Metrics are best-effort; the app keeps serving traffic
+        app.logger.warning('Metrics listener not started on [%s]:%s: %s', host, port, e)
+        return
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+
+
+def check_budgets(cfg) -> None:
+    """Raise ValueError if normal/low traffic could use every slot or thread."""
+    shared = cfg['ADMISSION_LIMIT_NORMAL'] + cfg['ADMISSION_LIMIT_LOW']
+    if shared >= cfg['ADMISSION_MAX_ACTIVE']:
+        raise ValueError(
+            f"ADMISSION_LIMIT_NORMAL + ADMISSION_LIMIT_LOW ({shared}) must be below "
+            f"ADMISSION_MAX_ACTIVE ({cfg['ADMISSION_MAX_ACTIVE']}) to leave slots for critical routes"
+        )
+    held = shared + cfg['ADMISSION_MAX_QUEUE_NORMAL'] + cfg['ADMISSION_MAX_QUEUE_LOW']
+    if held >= cfg['WEB_THREADS']:
+        raise ValueError(
+            f"Normal/low budgets plus queue caps ({held}) must be below WEB_THREADS "
+            f"({cfg['WEB_THREADS']}) to leave threads for critical routes"
+        )
+
+
+def init_admission(app: Flask) -> None:
+    """Attach admission control hooks and the internal /metrics endpoint to the app."""
+    cfg = app.config
+    if cfg['ADMISSION_ENABLED']:
+        check_budgets(cfg)
+    controller = AdmissionController(
+        max_active=cfg['ADMISSION_MAX_ACTIVE'],
+        limits={
+            CRITICAL: cfg['ADMISSION_LIMIT_CRITICAL'],
+            NORMAL: cfg['ADMISSION_LIMIT_NORMAL'],
+            LOW: cfg['ADMISSION_LIMIT_LOW'],
+        },
+        max_wait={
+            CRITICAL: cfg['ADMISSION_MAX_WAIT_CRITICAL'],
+            NORMAL: cfg['ADMISSION_MAX_WAIT_NORMAL'],
+            LOW: cfg['ADMISSION_MAX_WAIT_LOW'],
+        },
+        max_queue={
+            CRITICAL: None,
+            NORMAL: cfg['ADMISSION_MAX_QUEUE_NORMAL'],
+            LOW: cfg['ADMISSION_MAX_QUEUE_LOW'],
+        },
+    )
+    app.extensions['admission'] = controller
+
+    @app.get('/metrics')
+    def metrics():
+        # Only reachable through the internal listener, never the public port
+        if not request.environ.get(INTERNAL_ENVIRON_KEY):
+            abort(404)
+        return (controller.render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4'})
+
+    if not cfg['ADMISSION_ENABLED']:
+        return
+
+    @app.before_request
+    def admission_acquire():
+        route_class = classify_endpoint(request.endpoint)
+        if route_class is None:
+            return None
+        if not controller.acquire(route_class):
+            retry_after = cfg['ADMISSION_RETRY_AFTER']
+            if request.endpoint in BROWSER_CALLBACK_ENDPOINTS:
+                attempt = request.args.get('attempt', 0, type=int) + 1
+                resp = app.make_response(render_template(
+                    'retry.html',
+                    action=request.path,
+                    fields=request.form.items(multi=True),
+                    attempt=attempt,
+                    auto_retry=attempt <= cfg['ADMISSION_CALLBACK_AUTO_RETRIES'],
+                    retry_after=retry_after,
+                ))
+            else:
+                resp = jsonify({'ok': False, 'error': 'Server busy, please retry'})
+            resp.status_code = 503
+            resp.headers['Retry-After'] = str(retry_after)
+            return resp
+        g.admission_class = route_class
+        return None
+
+    @app.teardown_request
+    def admission_release(exc=None):
+        route_class = g.pop('admission_class', None)
+        if route_class is not None:
+            controller.release(route_class)
@@ -9,6 +9,7 @@ from config import Config
 from models import db, User, Order, Payment, BBPSPayment, Ledger, IdempotencyKey
 from utils import create_razorpay_order, get_razorpay_client, build_payu_params, payu_verify_response_hash
 from webhook_handlers import webhooks_bp
+from admission import init_admission
 
 
 def create_app() -> Flask:
@@ -25,6 +26,9 @@ def create_app() -> Flask:
     # Register blueprints
     app.register_blueprint(webhooks_bp)
 
+    # Per-route-class admission control (callbacks/webhooks ahead of page traffic)
+    init_admission(app)
+
     @app.get("/healthz")
     def healthz():
         return {"status": "ok", "time": datetime.utcnow().isoformat()}
@@ -44,3 +44,36 @@ class Config:
     # Callback URLs (should be public URLs in production)
     PAYU_SUCCESS_URL = os.getenv("PAYU_SUCCESS_URL", "http://localhost:5000/payment/payu/success")
     PAYU_FAILURE_URL = os.getenv("PAYU_FAILURE_URL", "http://localhost:5000/payment/payu/failure")
+
+    # Gunicorn threads for the single gthread worker (read by gunicorn.conf.py). Keep it at or
+    # above Fly's http_service hard_limit so requests reach the admission queue.
+    WEB_THREADS = int(os.getenv("WEB_THREADS", "25"))
+
+    # Admission control: per-route-class concurrency budgets (per gunicorn worker process).
+    # Payment callbacks/webhooks are 'critical', /admin and receipt PDFs are 'low',
+    # everything else is 'normal'. init_admission() checks at startup that NORMAL + LOW
+    # stays below MAX_ACTIVE, and NORMAL + LOW + their queue caps below WEB_THREADS, so
+    # critical routes always have slots and threads left.
+    # MAX_ACTIVE requests may write to the DB at once; use Postgres (DATABASE_URL) in
+    # production, or keep MAX_ACTIVE low on SQLite.
+    ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1").lower() not in ("0", "false", "no")
+    ADMISSION_MAX_ACTIVE = int(os.getenv("ADMISSION_MAX_ACTIVE", "10"))
+    ADMISSION_LIMIT_CRITICAL = int(os.getenv("ADMISSION_LIMIT_CRITICAL", "10"))
+    ADMISSION_LIMIT_NORMAL = int(os.getenv("ADMISSION_LIMIT_NORMAL", "6"))
+    ADMISSION_LIMIT_LOW = int(os.getenv("ADMISSION_LIMIT_LOW", "2"))
+    # Max seconds a request may wait for a slot before it is shed with 503. Critical stays below
+    # Razorpay's webhook timeout (~5s) so a shed webhook gets a 503 it will retry, not a timeout.
+    # Only the Razorpay webhook is retried by the sender: shed PayU browser callbacks get a page
+    # that re-posts the form, and /verify_payment is retried by pay.html (see README).
+    ADMISSION_MAX_WAIT_CRITICAL = float(os.getenv("ADMISSION_MAX_WAIT_CRITICAL", "4"))
+    ADMISSION_MAX_WAIT_NORMAL = float(os.getenv("ADMISSION_MAX_WAIT_NORMAL", "5"))
+    ADMISSION_MAX_WAIT_LOW = float(os.getenv("ADMISSION_MAX_WAIT_LOW", "1"))
+    # Max requests queued per class; arrivals beyond this are shed at once (critical is uncapped)
+    ADMISSION_MAX_QUEUE_NORMAL = int(os.getenv("ADMISSION_MAX_QUEUE_NORMAL", "8"))
+    ADMISSION_MAX_QUEUE_LOW = int(os.getenv("ADMISSION_MAX_QUEUE_LOW", "2"))
+    ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "5"))
+    # Times a shed PayU success/failure page re-posts itself before asking the user to retry
+    ADMISSION_CALLBACK_AUTO_RETRIES = int(os.getenv("ADMISSION_CALLBACK_AUTO_RETRIES", "5"))
+    # Internal listener for /metrics, started by gunicorn.conf.py (scraped by Fly over the private network; 0 disables)
+    METRICS_HOST = os.getenv("METRICS_HOST", "::")
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "9091"))
@@ -0,0 +1,20 @@
+# Gunicorn settings, loaded automatically from the working directory.
+# One threaded worker so the admission controller in admission.py sees all traffic.
+import os
+
+from config import Config
+
+bind = f":{os.getenv('PORT', '8080')}"
+worker_class = "gthread"
+workers = 1
+threads = Config.WEB_THREADS
+
+
+def post_worker_init(worker):
+    # Start the internal /metrics listener inside the worker that serves traffic,
+    # so it reports that worker's admission controller (and survives --preload).
+    from admission import start_metrics_server
+
+    app = worker.wsgi
+    if 'admission' in app.extensions and app.config['METRICS_PORT']:
+        start_metrics_server(app, app.config['METRICS_HOST'], app.config['METRICS_PORT'])
@@ -0,0 +1,205 @@
+import importlib
+import os
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+from admission import (
+    CRITICAL, NORMAL, LOW, INTERNAL_ENVIRON_KEY, CRITICAL_ENDPOINTS, LOW_ENDPOINTS, EXEMPT_ENDPOINTS,
+    AdmissionController, check_budgets, classify_endpoint, init_admission,
+)
+from config import Config
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def make_controller(**overrides):
+    kwargs = dict(
+        max_active=2,
+        limits={CRITICAL: 2, NORMAL: 1, LOW: 1},
+        max_wait={CRITICAL: 5, NORMAL: 5, LOW: 5},
+        max_queue={CRITICAL: None, NORMAL: 4, LOW: 4},
+    )
+    kwargs.update(overrides)
+    return AdmissionController(**kwargs)
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture(scope='module')
+def real_app():
+    # app.py builds the app at import time; point it at an in-memory database first
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(Config, 'SQLALCHEMY_DATABASE_URI', 'sqlite://')
+        mp.setattr(Config, 'METRICS_PORT', 0)
+        module = importlib.import_module('app')
+        yield module.create_app()
+
+
+@pytest.fixture
+def app():
+    app = Flask('app', root_path=ROOT)
+    app.config.from_object(Config)
+    app.config.update(METRICS_PORT=0, ADMISSION_MAX_WAIT_CRITICAL=0.05,
+                      ADMISSION_MAX_WAIT_NORMAL=0.05, ADMISSION_MAX_WAIT_LOW=0.05)
+
+    @app.get('/healthz')
+    def healthz():
+        return {'status': 'ok'}
+
+    @app.get('/')
+    def index():
+        return 'index'
+
+    @app.get('/boom')
+    def boom():
+        raise RuntimeError('boom')
+
+    @app.post('/payment/payu/success')
+    def payu_success():
+        return 'paid'
+
+    init_admission(app)
+    return app
+
+
+def test_critical_granted_before_queued_normal():
+    controller = make_controller()
+    assert controller.acquire(NORMAL)
+    assert controller.acquire(CRITICAL)
+    order = []
+
+    def run(route_class):
+        controller.acquire(route_class)
+        order.append(route_class)
+
+    normal = threading.Thread(target=run, args=(NORMAL,))
+    normal.start()
+    assert wait_for(lambda: controller.snapshot()[NORMAL]['queued'] == 1)
+    critical = threading.Thread(target=run, args=(CRITICAL,))
+    critical.start()
+    assert wait_for(lambda: controller.snapshot()[CRITICAL]['queued'] == 1)
+
+    # Only the global budget is free now: the later critical request goes first
+    controller.release(NORMAL)
+    critical.join(2)
+    assert order == [CRITICAL]
+    controller.release(CRITICAL)
+    normal.join(2)
+    assert order == [CRITICAL, NORMAL]
+
+
+def test_sheds_on_arrival_when_queue_full():
+    controller = make_controller(max_queue={CRITICAL: None, NORMAL: 1, LOW: 1})
+    assert controller.acquire(NORMAL)
+    waiter = threading.Thread(target=controller.acquire, args=(NORMAL,))
+    waiter.start()
+    assert wait_for(lambda: controller.snapshot()[NORMAL]['queued'] == 1)
+
+    start = time.monotonic()
+    assert controller.acquire(NORMAL) is False
+    assert time.monotonic() - start < 0.5
+    assert controller.snapshot()[NORMAL]['shed'] == 1
+    controller.release(NORMAL)
+    waiter.join(2)
+
+
+def test_critical_wait_is_finite():
+    controller = make_controller(max_wait={CRITICAL: 0.05, NORMAL: 5, LOW: 5})
+    assert controller.acquire(CRITICAL)
+    assert controller.acquire(CRITICAL)
+    assert controller.acquire(CRITICAL) is False
+
+
+def test_shed_returns_503_with_retry_after(app):
+    controller = app.extensions['admission']
+    for _ in range(app.config['ADMISSION_LIMIT_NORMAL']):
+        assert controller.acquire(NORMAL)
+
+    resp = app.test_client().get('/')
+    assert resp.status_code == 503
+    assert resp.headers['Retry-After'] == str(app.config['ADMISSION_RETRY_AFTER'])
+    assert resp.get_json()['ok'] is False
+
+
+def test_shed_browser_callback_renders_resubmit_page(app):
+    controller = app.extensions['admission']
+    for _ in range(app.config['ADMISSION_MAX_ACTIVE']):
+        assert controller.acquire(CRITICAL)
+    client = app.test_client()
+
+    resp = client.post('/payment/payu/success', data={'txnid': 'abc123', 'status': 'success'})
+    assert resp.status_code == 503
+    assert resp.headers['Retry-After'] == str(app.config['ADMISSION_RETRY_AFTER'])
+    body = resp.get_data(as_text=True)
+    assert 'action="/payment/payu/success?attempt=1"' in body
+    assert 'name="txnid" value="abc123"' in body
+    assert 'setTimeout' in body
+
+    # After the auto-retry budget the page waits for the user instead of looping
+    attempt = app.config['ADMISSION_CALLBACK_AUTO_RETRIES']
+    resp = client.post(f'/payment/payu/success?attempt={attempt}', data={'txnid': 'abc123'})
+    assert resp.status_code == 503
+    assert 'setTimeout' not in resp.get_data(as_text=True)
+
+    for _ in range(app.config['ADMISSION_MAX_ACTIVE']):
+        controller.release(CRITICAL)
+    assert client.post('/payment/payu/success', data={'txnid': 'abc123'}).data == b'paid'
+
+
+def test_exempt_endpoints_skip_queue(app):
+    controller = app.extensions['admission']
+    for _ in range(app.config['ADMISSION_MAX_ACTIVE']):
+        assert controller.acquire(CRITICAL)
+    client = app.test_client()
+
+    assert client.get('/healthz').status_code == 200
+    static = client.get('/static/css/tailwind.css')
+    assert static.status_code == 200
+    static.close()
+    resp = client.get('/metrics', environ_overrides={INTERNAL_ENVIRON_KEY: True})
+    assert resp.status_code == 200
+    assert b'admission_queue_depth{class="normal"} 0' in resp.data
+
+
+def test_metrics_hidden_on_public_port(app):
+    assert app.test_client().get('/metrics').status_code == 404
+
+
+def test_slot_released_when_view_raises(app):
+    app.config['PROPAGATE_EXCEPTIONS'] = False
+    resp = app.test_client().get('/boom')
+    assert resp.status_code == 500
+    snap = app.extensions['admission'].snapshot()
+    assert snap[NORMAL]['active'] == 0
+    assert snap[NORMAL]['admitted'] == 1
+
+
+def test_check_budgets_rejects_overlapping_limits():
+    cfg = {k: getattr(Config, k) for k in dir(Config) if k.isupper()}
+    check_budgets(cfg)
+    with pytest.raises(ValueError):
+        check_budgets(dict(cfg, ADMISSION_LIMIT_NORMAL=cfg['ADMISSION_MAX_ACTIVE']))
+    with pytest.raises(ValueError):
+        check_budgets(dict(cfg, WEB_THREADS=10))
+
+
+def test_listed_endpoints_exist_in_real_app(real_app):
+    endpoints = {rule.endpoint for rule in real_app.url_map.iter_rules()}
+    for name in CRITICAL_ENDPOINTS | LOW_ENDPOINTS | EXEMPT_ENDPOINTS:
+        assert name in endpoints, f'{name} is not a route in app.py'
+
+
+def test_callbacks_and_webhooks_are_critical(real_app):
+    for rule in real_app.url_map.iter_rules():
+        if rule.rule.startswith(('/webhook/', '/payment/payu/')) or rule.endpoint == 'verify_payment':
+            assert classify_endpoint(rule.endpoint) == CRITICAL, rule.rule